@@ -0,0 +1,23 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+# Compiled XOR checksum for the UART packet framing used by the plotters.
+# Build in place with: python setup.py build_ext --inplace
+from libc.stdint cimport uint64_t
+
+
+cpdef unsigned char xor_cs(const unsigned char[::1] buf) nogil:
+    """XOR all bytes of buf together, 8 bytes per step via a uint64 accumulator."""
+    cdef uint64_t acc = 0          # 64-bit accumulator, XORs 8 bytes per iteration
+    cdef Py_ssize_t i = 0
+    cdef Py_ssize_t n = buf.shape[0]
+    cdef unsigned char cs
+    while i + 8 <= n:
+        acc ^= (<const uint64_t*>&buf[i])[0]  # Load and XOR one 8-byte lane
+        i += 8
+    acc ^= acc >> 32               # Fold the accumulator down to a single byte
+    acc ^= acc >> 16
+    acc ^= acc >> 8
+    cs = <unsigned char>(acc & 0xFF)
+    while i < n:                   # XOR any trailing bytes one at a time
+        cs ^= buf[i]
+        i += 1
+    return cs
@@ -1,26 +1,76 @@
+import re  # Precompiled scanner for frame candidates
+import sys  # For platform check in low-latency setup
+import threading  # Background thread for UART draining
+import time  # Idle sleep in the reader thread
 import serial  # For communicating with STM32 via UART
 import matplotlib.pyplot as plt  # For plotting data
 import matplotlib.animation as animation  # For real-time animation updates
 from collections import deque  # Efficient queue for fixed-length data storage
 import numpy as np  # For numerical operations, used in frequency estimation
+from numba import njit  # JIT compiler for the fused statistics kernel
 from matplotlib.widgets import Button  # For creating a pause/resume button
 
+try:
+    from checksum_ext import xor_cs  # Compiled XOR checksum (build with setup.py)
+except ImportError:
+    xor_cs = None  # Extension not built; fall back to numpy reduction
+
 # -----------------------------
 # Serial configuration
 # -----------------------------
-ser = serial.Serial('COM14', 921600, timeout=0.1)  # Open serial port COM14, baud rate 921600, timeout 0.1s
+ser = serial.Serial('COM14', 921600, timeout=0)  # Open serial port COM14, baud rate 921600, non-blocking reads
+READ_CHUNK = 65536  # Drain up to 64 KB per read instead of one frame's worth
+
+def set_low_latency(port):
+    """Reduce USB-serial buffering latency (e.g. the 16 ms FTDI latency timer)."""
+    if not sys.platform.startswith('linux'):
+        return  # On Windows, timeout=0 already selects immediate-return COMMTIMEOUTS
+    try:
+        import array
+        import fcntl
+        TIOCGSERIAL, TIOCSSERIAL = 0x541E, 0x541F
+        ASYNC_LOW_LATENCY = 0x2000
+        ss = array.array('i', [0] * 64)  # Scratch for struct serial_struct
+        fcntl.ioctl(port.fd, TIOCGSERIAL, ss)
+        ss[4] |= ASYNC_LOW_LATENCY  # flags field: deliver data every USB frame (~1 ms)
+        fcntl.ioctl(port.fd, TIOCSSERIAL, ss)
+    except OSError:
+        pass  # Driver does not support it; keep default latency
+
+set_low_latency(ser)
 
 # -----------------------------
 # Plot configuration
 # -----------------------------
 max_points = 200  # Number of points to display in the sliding window of the plot
-y_data = deque([0]*max_points, maxlen=max_points)  # Initialize y-values with zeros
-x_data = deque(range(max_points), maxlen=max_points)  # x-values as sample indices (0..199)
+y_buf = np.zeros(max_points, dtype=np.uint8)  # Preallocated ring buffer for y-values
+y_disp = np.zeros(max_points, dtype=np.uint8)  # Reused display buffer, oldest-to-newest order
+y_cent = np.zeros(max_points, dtype=np.float32)  # Reused scratch for the mean-subtracted window
+write = 0  # Ring write cursor (next index to fill; also the oldest sample)
+x_data = np.arange(max_points, dtype=np.int32)  # x-values as sample indices (0..199); constant, never mutated
+
+def ring_extend(data):
+    """Copy a payload into the ring buffer, wrapping at the end."""
+    global write
+    payload = np.frombuffer(data, dtype=np.uint8)  # Zero-copy uint8 view of payload
+    n = payload.size
+    if n >= max_points:  # Payload alone fills the window: keep only the newest samples
+        y_buf[:] = payload[n - max_points:]
+        write = 0
+        return
+    end = write + n
+    if end <= max_points:
+        y_buf[write:end] = payload  # Fits without wrapping: one slice copy
+    else:
+        split = max_points - write
+        y_buf[write:] = payload[:split]  # Fill up to the end of the buffer
+        y_buf[:end - max_points] = payload[split:]  # Wrap remainder to the front
+    write = end % max_points
 
 fig, ax = plt.subplots()  # Create figure and axes for plotting
 plt.subplots_adjust(bottom=0.2)  # Make space at bottom for pause/resume button
-line, = ax.plot(x_data, y_data, color='blue')  # Plot initial line, store reference for updates
-legend_text = ax.text(0.7, 1.05, '', transform=ax.transAxes)  # Text for displaying Peak-to-Peak and frequency
+line, = ax.plot(x_data, y_buf, color='blue')  # Plot initial line, store reference for updates
+legend_text = ax.text(0.7, 0.95, '', transform=ax.transAxes, va='top')  # Peak-to-Peak/frequency readout; must sit inside ax.bbox so blitting draws it
 ax.set_ylim(0, 255)  # Set initial Y-axis limits (assuming 8-bit ADC data)
 ax.set_xlabel("Samples")  # Label X-axis
 ax.set_ylabel("Amplitude")  # Label Y-axis
@@ -45,85 +95,186 @@ ax_button = plt.axes([0.8, 0.05, 0.1, 0.075])  # Define button position (x, y, w
 btn = Button(ax_button, 'Pause')  # Create button labeled 'Pause'
 btn.on_clicked(toggle_pause)  # Link button click to toggle_pause function
 
+def on_key(event):
+    """Toggle checksum verification with the 'v' key (diagnostic use)."""
+    global VERIFY_CHECKSUMS
+    if event.key == 'v':
+        VERIFY_CHECKSUMS = not VERIFY_CHECKSUMS  # Flip verification flag
+        print("Checksum verification", "on" if VERIFY_CHECKSUMS else "off")
+
+fig.canvas.mpl_connect('key_press_event', on_key)  # Connect keybinding
+
 # -----------------------------
 # Checksum verification
 # -----------------------------
+VERIFY_CHECKSUMS = True  # Set False (or press 'v') to trust the link and skip verification
+_XOR = np.bitwise_xor.reduce  # C-level XOR reduction over a uint8 array
+
 def verify_checksum(data, checksum):
     """
     Verify a simple XOR checksum.
-    data: list/bytes of payload
+    data: bytes/bytearray of payload
     checksum: byte value received
     """
-    cs = 0  # Initialize checksum variable
-    for b in data:
-        cs ^= b  # XOR each data byte
-    return cs == checksum  # Return True if computed checksum matches received one
+    if xor_cs is not None:  # Compiled path: one C call, no per-byte boxing
+        return xor_cs(memoryview(data)) == checksum
+    if len(data) < 16:  # Short payload: numpy call overhead dominates, fold in pure Python
+        cs = 0  # Initialize 64-bit accumulator
+        for i in range(0, len(data), 8):
+            cs ^= int.from_bytes(data[i:i+8], 'little')  # XOR 8 payload bytes at a time
+        cs ^= cs >> 32  # Fold upper half into lower
+        cs ^= cs >> 16
+        cs ^= cs >> 8
+        return (cs & 0xFF) == checksum  # Return True if computed checksum matches received one
+    # Long payload: single XOR reduction in C over contiguous memory
+    return int(_XOR(np.frombuffer(data, dtype=np.uint8))) == checksum
 
 # -----------------------------
-# Frequency estimation
+# Fused signal statistics
 # -----------------------------
-def estimate_frequency(y_values, sample_rate):
+@njit(cache=True)
+def render_stats(ring, start, disp, cent):
+    """
+    Fused per-frame kernel over the ring buffer.
+    ring: uint8 ring buffer, oldest sample at index start
+    disp: uint8 output, filled oldest-to-newest for the plot
+    cent: float32 output, filled with disp - mean
+    Computes min/max/mean along the way and returns (y_min, y_max, mean);
+    everything the frame needs from the samples in one compiled sweep.
+    """
+    n = ring.size
+    mn = 255  # Running minimum (8-bit ADC range)
+    mx = 0  # Running maximum
+    total = 0.0  # Sum for mean
+    for i in range(n):
+        v = ring[(start + i) % n]
+        disp[i] = v  # Oldest-to-newest display order
+        if v < mn:
+            mn = v
+        if v > mx:
+            mx = v
+        total += v
+    mean = total / n
+    for i in range(n):  # Second pass needs the mean; stays inside the kernel
+        cent[i] = disp[i] - mean
+    return mn, mx, mean
+
+def estimate_frequency(centered, sample_rate):
     """
-    Estimate frequency using zero-crossings method.
-    y_values: deque/list of signal amplitudes
+    Estimate the fundamental from the FFT magnitude peak.
+    centered: float32 array of mean-subtracted amplitudes (oldest to newest)
     sample_rate: sampling frequency in Hz
+    Takes the already mean-subtracted window so the centering is not
+    recomputed here. Far more robust on noisy signals than the previous
+    zero-crossing estimator; rfft on a 200-sample window costs microseconds.
     """
-    y_array = np.array(y_values)  # Convert deque to NumPy array
-    mean_val = np.mean(y_array)  # Compute mean to center the waveform
-    crossings = np.where(np.diff(np.sign(y_array - mean_val)) > 0)[0]  # Detect rising zero-crossings
-    if len(crossings) < 2:  # If fewer than 2 crossings, cannot estimate frequency
-        return 0
-    period_samples = np.mean(np.diff(crossings))  # Average number of samples per period
-    freq = sample_rate / period_samples  # Convert period to frequency in Hz
-    return freq
+    spec = np.abs(np.fft.rfft(centered))  # Spectrum of the centered waveform
+    k = int(spec[1:].argmax()) + 1  # Strongest non-DC bin
+    if spec[k] == 0.0:  # Flat signal: no fundamental
+        return 0.0
+    if k < spec.size - 1:  # Parabolic interpolation for sub-bin resolution
+        denom = spec[k - 1] - 2.0 * spec[k] + spec[k + 1]
+        if denom != 0.0:
+            k = k + 0.5 * (spec[k - 1] - spec[k + 1]) / denom
+    return k * sample_rate / centered.size
 
 # -----------------------------
-# Animation update function
+# Background UART reader
 # -----------------------------
 buffer = bytearray()  # Buffer to store incoming UART bytes
-SAMPLE_RATE = 10000  # Sampling rate of STM32 in Hz
+head = 0  # Parse cursor; consumed bytes stay in place until compaction
+COMPACT_AT = 4096  # Compact the buffer once this many bytes are consumed
+MAX_PAYLOAD = 64  # Sanity bound on the length byte (firmware sends at most 20)
+_FRAME = re.compile(b'\xAA.', re.DOTALL)  # Start byte followed by a length byte, one C-level scan
+pkt_q = deque(maxlen=1024)  # Verified payloads queued for the GUI thread
+last_cs = None  # Checksum of the last accepted packet
+last_data = b''  # Payload of the last accepted packet
 
-def update(frame):
+def reader():
     """
-    Update function called by FuncAnimation every interval.
-    Reads serial data, parses packets, updates plot and legend text.
+    Runs in a daemon thread: continuously drains the UART, parses
+    packets and queues verified payloads for the animation callback.
     """
-    global buffer, paused
-    try:
-        # Read all available bytes from UART; if none, read at least 1
-        buffer += ser.read(ser.in_waiting or 1)
+    global buffer, head, last_cs, last_data
+    while True:
+        try:
+            # Non-blocking drain of everything available, up to 64 KB
+            chunk = ser.read(READ_CHUNK)
+            if not chunk:
+                time.sleep(0.001)  # Port idle: yield instead of spinning
+                continue
+            buffer += chunk
 
-        if not paused:  # Only update the plot if not paused
             while True:
-                if len(buffer) < 3:  # Minimum packet size: start + length + checksum
+                m = _FRAME.search(buffer, head)  # Scan for start byte + length pair in one call
+                if m is None:  # No candidate; keep a trailing lone 0xAA for the next chunk
+                    head = len(buffer) - 1 if buffer.endswith(b'\xAA') else len(buffer)
+                    break
+                head = m.start()  # Candidate frame begins here
+                if len(buffer) < head + 3:  # Minimum packet size: start + length + checksum
                     break
 
-                if buffer[0] != 0xAA:  # Sync to start byte 0xAA
-                    buffer.pop(0)  # Remove first byte until start byte found
+                length = buffer[head + 1]  # Byte after start indicates payload length
+                if length == 0 or length > MAX_PAYLOAD:  # Implausible length: false sync on a stray 0xAA
+                    head += 1  # Cheap structural rejection before touching the payload
                     continue
-
-                length = buffer[1]  # Second byte indicates payload length
-                if len(buffer) < 2 + length + 1:  # Full packet not yet received
+                if len(buffer) < head + 2 + length + 1:  # Full packet not yet received
                     break
 
-                data = buffer[2:2+length]  # Extract payload bytes
-                checksum = buffer[2+length]  # Extract checksum byte
+                data = memoryview(buffer)[head + 2:head + 2 + length]  # Payload, no copy
+                checksum = buffer[head + 2 + length]  # Extract checksum byte
 
-                if verify_checksum(data, checksum):  # Validate packet
-                    y_data.extend(data)  # Append payload to y_data
+                if not VERIFY_CHECKSUMS or verify_checksum(data, checksum):  # Validate packet
+                    # A repeated checksum almost always means a repeated payload;
+                    # confirm byte-wise and skip queueing exact duplicates
+                    if checksum != last_cs or data != last_data:
+                        last_cs = checksum
+                        last_data = bytes(data)
+                        pkt_q.append(last_data)  # Hand an immutable copy to the GUI thread
                 else:
-                    print("Checksum failed:", list(buffer[:2+length+1]))  # Print failed packet
+                    print("Checksum failed:", list(buffer[head:head + 3 + length]))  # Print failed packet
+
+                data.release()  # Drop the view so the bytearray can be compacted
+                head += 3 + length  # Advance cursor past this packet
+
+            if head > COMPACT_AT:  # Amortized cleanup: one memmove every ~4 KB parsed
+                del buffer[:head]
+                head = 0
+
+        except Exception as e:
+            print("Error:", e)  # Print any exceptions
+
+threading.Thread(target=reader, daemon=True).start()  # I/O runs independently of rendering
+
+# -----------------------------
+# Animation update function
+# -----------------------------
+SAMPLE_RATE = 10000  # Sampling rate of STM32 in Hz
 
-                buffer = buffer[2+length+1:]  # Remove processed packet from buffer
+def update(frame):
+    """
+    Update function called by FuncAnimation every interval.
+    Drains queued payloads into the ring buffer, updates plot and legend text.
+    """
+    dirty = False  # True once new samples reach the ring buffer this frame
+    if not paused and pkt_q:  # Only take new data if not paused
+        chunks = []
+        while pkt_q:
+            chunks.append(pkt_q.popleft())  # deque append/popleft are thread-safe
+        ring_extend(b''.join(chunks))  # One fused slice write for the whole frame
+        dirty = True
 
-    except Exception as e:
-        print("Error:", e)  # Print any exceptions
+    if not dirty:  # Visible window unchanged: skip all redraw work
+        return line, legend_text
 
-    line.set_ydata(y_data)  # Update line y-values for plot
+    # One compiled sweep: orders the ring into y_disp, computes min/max/mean
+    # and fills the centered float32 scratch
+    y_min, y_max, _ = render_stats(y_buf, write, y_disp, y_cent)
+    line.set_ydata(y_disp)  # Update line y-values for plot
 
-    # Compute peak-to-peak amplitude and estimated frequency
-    vpp = max(y_data) - min(y_data)
-    freq = estimate_frequency(y_data, SAMPLE_RATE)
+    # Peak-to-peak from the same sweep; frequency from the spectrum peak
+    vpp = y_max - y_min
+    freq = estimate_frequency(y_cent, SAMPLE_RATE)
 
     legend_text.set_text(f'Peak-to-Peak={vpp:.1f}, Freq={freq:.1f} Hz')  # Update legend text
 
@@ -132,5 +283,8 @@ def update(frame):
 # -----------------------------
 # Run animation
 # -----------------------------
-ani = animation.FuncAnimation(fig, update, interval=10, blit=False)  # Call update every 10 ms
+# 33 ms (~30 FPS) matches what the canvas can actually render; the reader
+# thread keeps draining the UART between frames, so no data is lost.
+# cache_frame_data=False stops FuncAnimation retaining every frame value.
+ani = animation.FuncAnimation(fig, update, interval=33, blit=True, cache_frame_data=False)
 plt.show()  # Display interactive plot window
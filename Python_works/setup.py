@@ -0,0 +1,20 @@
+# Builds the compiled XOR checksum extension used by the plotter scripts.
+# Usage: python setup.py build_ext --inplace
+import sys
+
+from Cython.Build import cythonize
+from setuptools import Extension, setup
+
+# MSVC has no -O3/-march flags; /O2 is its highest optimization level
+if sys.platform == 'win32':
+    compile_args = ['/O2']
+else:
+    compile_args = ['-O3', '-march=native']
+
+setup(
+    name='checksum_ext',
+    ext_modules=cythonize([
+        Extension('checksum_ext', ['checksum_ext.pyx'],
+                  extra_compile_args=compile_args),
+    ]),
+)